@@ -0,0 +1,373 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Benchmark helper functions for jn_utils.py
+#
+# python ./jn_utils_bench.py scanners ./debug.log
+# python ./jn_utils_bench.py inserts ./debug.log
+# python ./jn_utils_bench.py bundle /tmp/bench_bundle [log MB]
+#
+"""
+jn_utils_bench measures the ingestion paths of jn_utils (ju) to compare the engines/options.
+"""
+
+import sys, os, tempfile, gzip, json, random
+from time import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import pandas as pd
+import jn_utils as ju
+
+_LINE_BEGINNING = "^\d\d\d\d-\d\d-\d\d"
+_LINE_MATCHING = "^(\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d,\d\d\d) (.+?) \[(.+?)\] (\{.*?\}) (.+)"
+_SIZE_REGEX = "[sS]ize =? ?([0-9]+)"
+_TIME_REGEX = "time = ([0-9.,]+ ?m?s)"
+_LOG_LEVELS = ['DEBUG'] * 6 + ['INFO'] * 3 + ['WARN', 'ERROR']
+_MESSAGES = ["Executing query on connection %(conn)s size = %(size)d time = %(ms).1f ms",
+             "Cache hit for aggregate %(agg)s size = %(size)d",
+             "Finished planning query %(query)s time = %(ms).1f ms",
+             "Sending %(size)d rows to client %(conn)s"]
+# Representative queries for bench_bundle(). %(t_log)s and %(t_csv)s are replaced with the table names
+_BENCH_QUERIES = OrderedDict([
+    ('group_by_level', "SELECT loglevel, count(*) AS c FROM %(t_log)s GROUP BY loglevel"),
+    ('time_range', "SELECT * FROM %(t_log)s WHERE datetime BETWEEN '2018-08-28 10:00:10' AND '2018-08-28 10:00:20'"),
+    ('slow_threads', "SELECT thread, max(time) AS max_ms, avg(size) AS avg_size FROM %(t_log)s GROUP BY thread "
+                     "ORDER BY max_ms DESC LIMIT 10"),
+    ('like_exception', "SELECT count(*) AS c FROM %(t_log)s WHERE message LIKE '%%Exception%%'"),
+    ('csv_aggregate', "SELECT c1, count(*) AS c, avg(c2) AS a FROM %(t_csv)s GROUP BY c1"),
+])
+
+
+def _measure(func_obj, **kwargs):
+    """
+    Execute the function and measure the elapsed time
+    :param func_obj: A function object to be executed
+    :param kwargs: Arguments for the function
+    :return: (elapsed seconds, result)
+    >>> _measure(lambda x: x * 2, x=2)[1]
+    4
+    """
+    started = time()
+    rtn = func_obj(**kwargs)
+    return (time() - started, rtn)
+
+
+def _reset_peak_rss():
+    """
+    Reset the peak RSS (VmHWM) of this process, so that each step's peak can be measured (Linux only)
+    :return: True if reset
+    >>> _reset_peak_rss() in (True, False)
+    True
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except (IOError, OSError):
+        return False
+
+
+def _peak_rss_mb():
+    """
+    Peak RSS of this process in MB (since the last _reset_peak_rss() on Linux). Child processes are not included
+    :return: Float
+    >>> _peak_rss_mb() > 0
+    True
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for l in f:
+                if l.startswith("VmHWM:"):
+                    return int(l.split()[1]) / 1024.0
+    except (IOError, OSError):
+        pass
+    import resource
+    # KB on Linux, bytes on Mac
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024.0 / (1024.0 if sys.platform == 'darwin' else 1.0)
+
+
+def _gen_log(file_path, mb, rnd, started=datetime(2018, 8, 28, 10, 0, 0), trace_ratio=0.02):
+    """
+    Write a synthetic log file (same format as _LINE_MATCHING) which contains multi-lines stack traces
+    :param file_path: File path. If it ends with .gz, gzip compressed
+    :param mb: Approximate (uncompressed) size in MB
+    :param rnd: random.Random object
+    :param started: The datetime of the first line
+    :param trace_ratio: Ratio of WARN/ERROR entries which have a stack trace
+    :return: Number of log entries
+    >>> _gen_log('/tmp/test_gen_log.log', 0.01, random.Random(1)) > 0
+    True
+    >>> os.remove('/tmp/test_gen_log.log')
+    """
+    f = gzip.open(file_path, "wt") if file_path.endswith(".gz") else open(file_path, "w")
+    size = int(mb * 1024 * 1024)
+    written = 0
+    n = 0
+    dt = started
+    with f:
+        while written < size:
+            dt += timedelta(milliseconds=rnd.randint(0, 20))
+            level = rnd.choice(_LOG_LEVELS)
+            msg = rnd.choice(_MESSAGES) % {'conn': "c%03d" % (rnd.randint(0, 50)), 'agg': "agg_%d" % rnd.randint(0, 200),
+                                           'query': "%08x" % (rnd.getrandbits(32)), 'size': rnd.randint(0, 10 ** 6),
+                                           'ms': rnd.random() * 5000}
+            line = "%s,%03d %s [thread-%d] {queryId=%08x} %s\n" % (
+                dt.strftime("%Y-%m-%d %H:%M:%S"), dt.microsecond // 1000, level, rnd.randint(1, 32),
+                rnd.getrandbits(32), msg)
+            if level in ('WARN', 'ERROR') and rnd.random() < trace_ratio * 5:
+                line += "java.lang.IllegalStateException: Unexpected state %d\n" % (rnd.randint(0, 100))
+                line += "".join("\tat com.example.engine.Worker%d.run(Worker.java:%d)\n" % (i, rnd.randint(1, 999))
+                                for i in range(rnd.randint(3, 15)))
+            f.write(line)
+            written += len(line)
+            n += 1
+    return n
+
+
+def _gen_json(file_path, rows, rnd):
+    """
+    Write a synthetic JSON file (an array of nested objects, like engine/aggregates/*.json)
+    :param file_path: File path
+    :param rows: Number of objects
+    :param rnd: random.Random object
+    :return: void
+    >>> _gen_json('/tmp/test_gen_json.json', 2, random.Random(1));len(json.load(open('/tmp/test_gen_json.json')))
+    2
+    >>> os.remove('/tmp/test_gen_json.json')
+    """
+    records = []
+    for i in range(rows):
+        records.append({'id': "agg_%d" % (i), 'name': "Aggregate %d" % (i), 'connectionId': "c%03d" % (i % 50),
+                        'buildTimeMs': rnd.randint(10, 100000), 'rows': rnd.randint(0, 10 ** 7),
+                        'stats': {'hits': rnd.randint(0, 1000), 'lastUsed': "2018-08-28T10:%02d:00" % (i % 60)},
+                        'columns': [{'name': "col%d" % (j), 'type': rnd.choice(['int', 'string', 'double'])}
+                                    for j in range(rnd.randint(1, 5))]})
+    with open(file_path, "w") as f:
+        json.dump(records, f)
+
+
+def _gen_csv(file_path, rows, cols, rnd):
+    """
+    Write a synthetic wide CSV file (like stats/*.csv). c0 is an integer id, c1 a category, c2 a float, and the
+    other columns are integers, floats or strings. Some values are empty
+    :param file_path: File path
+    :param rows: Number of rows
+    :param cols: Number of columns (at least 3)
+    :param rnd: random.Random object
+    :return: void
+    >>> _gen_csv('/tmp/test_gen_csv.csv', 2, 5, random.Random(1));open('/tmp/test_gen_csv.csv').readline().strip()
+    'c0,c1,c2,c3,c4'
+    >>> os.remove('/tmp/test_gen_csv.csv')
+    """
+    cols = max(cols, 3)
+    kinds = [rnd.choice(['int', 'float', 'str']) for _ in range(cols)]
+    with open(file_path, "w") as f:
+        f.write(",".join("c%d" % (i) for i in range(cols)) + "\n")
+        for r in range(rows):
+            values = [str(r), "cat%d" % (r % 20), "%.3f" % (rnd.random() * 100)]
+            for i in range(3, cols):
+                if rnd.random() < 0.05:
+                    values.append("")
+                elif kinds[i] == 'int':
+                    values.append(str(rnd.randint(0, 10 ** 6)))
+                elif kinds[i] == 'float':
+                    values.append("%.4f" % (rnd.random()))
+                else:
+                    values.append("v%d" % (rnd.randint(0, 1000)))
+            f.write(",".join(values) + "\n")
+
+
+def gen_bundle(dest_dir, log_mb=10, log_files=2, json_files=3, json_rows=10000, csv_files=3, csv_rows=20000,
+               csv_cols=50, seed=1):
+    """
+    Generate a synthetic support bundle: logs/ (plain and gzip logs with stack traces), engine/aggregates/ (nested
+    JSON files) and stats/ (wide CSV files). Same seed generates same contents
+    :param dest_dir: Destination directory (created if not exists)
+    :param log_mb: Approximate uncompressed MB per log file
+    :param log_files: Number of log files. Every second file is gzip compressed
+    :param json_files: Number of JSON files
+    :param json_rows: Number of objects per JSON file
+    :param csv_files: Number of CSV files
+    :param csv_rows: Number of rows per CSV file
+    :param csv_cols: Number of columns per CSV file
+    :param seed: Random seed
+    :return: dest_dir
+    >>> d = gen_bundle('/tmp/test_gen_bundle', log_mb=0.01, json_rows=2, csv_rows=2, csv_cols=4)
+    >>> sorted(os.listdir(d + '/logs'))
+    ['bench.0.log', 'bench.1.log.gz']
+    >>> import shutil;shutil.rmtree(d)
+    """
+    rnd = random.Random(seed)
+    for sub in ['logs', 'engine/aggregates', 'stats']:
+        if os.path.isdir(os.path.join(dest_dir, sub)) is False:
+            os.makedirs(os.path.join(dest_dir, sub))
+    for i in range(log_files):
+        ext = ".log.gz" if i % 2 == 1 else ".log"
+        _gen_log(os.path.join(dest_dir, 'logs', "bench.%d%s" % (i, ext)), log_mb, rnd,
+                 started=datetime(2018, 8, 28, 10, 0, 0) + timedelta(hours=i))
+    for i in range(json_files):
+        _gen_json(os.path.join(dest_dir, 'engine/aggregates', "aggregates_%d.json" % (i)), json_rows, rnd)
+    for i in range(csv_files):
+        _gen_csv(os.path.join(dest_dir, 'stats', "stats_%d.csv" % (i)), csv_rows, csv_cols, rnd)
+    return dest_dir
+
+
+def _bench_step(rows, step, func_obj, mb=None, count_rows=None, **kwargs):
+    """
+    Measure one step of bench_bundle() and append [step, rows, MB, seconds, MB/s, rows/s, peak RSS MB] to 'rows'
+    :param rows: A list to append the result
+    :param step: Step name
+    :param func_obj: A function object to be executed
+    :param mb: (optional) Input MB to calculate MB/s
+    :param count_rows: (optional) A function which returns the number of rows from the func_obj's result
+    :param kwargs: Arguments for the function
+    :return: func_obj's result
+    >>> l = [];_bench_step(l, 'test', lambda x: [x], count_rows=len, x=1);l[0][:2]
+    [1]
+    ['test', 1]
+    """
+    _reset_peak_rss()
+    (sec, rtn) = _measure(func_obj, **kwargs)
+    n = count_rows(rtn) if count_rows is not None else None
+    rows.append([step, n, mb, sec, (mb / sec) if bool(mb) and sec > 0 else None,
+                 (n / sec) if bool(n) and sec > 0 else None, _peak_rss_mb()])
+    return rtn
+
+
+def bench_bundle(bundle_dir, db_path=None, multiprocessing=False, query_repeat=3):
+    """
+    Run logs2table, logs2dfs, load_jsons, load_csvs and representative queries (_BENCH_QUERIES) against a bundle
+    from gen_bundle(), so that regressions and improvements are visible
+    :param bundle_dir: A directory generated by gen_bundle()
+    :param db_path: (optional) SQLite DB file path. If None, a temporary file in bundle_dir (removed after)
+    :param multiprocessing: Passed to the loaders
+    :param query_repeat: Number of executions per query (the query result cache is not used)
+    :return: A DataFrame object (step, rows, mb, seconds, mb_per_sec, rows_per_sec, peak_rss_mb). peak_rss_mb is
+             per step on Linux, otherwise since the process started. Worker processes are not included
+    >>> d = gen_bundle('/tmp/test_bench_bundle', log_mb=0.05, json_rows=5, csv_rows=20, csv_cols=5)
+    >>> df = bench_bundle(d, query_repeat=1)
+    >>> df['step'].tolist()[:4]
+    ['logs2table', 'logs2dfs', 'load_jsons', 'load_csvs']
+    >>> bool((df['rows'].iloc[:4] > 0).all())
+    True
+    >>> import shutil;shutil.rmtree(d)
+    """
+    bundle_dir = os.path.abspath(bundle_dir)
+    remove_db = db_path is None
+    if db_path is None:
+        db_path = os.path.join(bundle_dir, "bench.db")
+    for f in [db_path, db_path + "-wal", db_path + "-shm"]:
+        if os.path.exists(f): os.remove(f)
+
+    def _mb(sub):
+        return sum(os.path.getsize(f) for f in ju._globr('*', os.path.join(bundle_dir, sub))) / 1024.0 / 1024.0
+
+    rows = []
+    conn = ju._db(db_path)
+    prev_dir = os.getcwd()
+    # logs2table/logs2dfs find files from the current directory
+    os.chdir(os.path.join(bundle_dir, 'logs'))
+    try:
+        _bench_step(rows, 'logs2table', ju.logs2table, mb=_mb('logs'), count_rows=lambda _: conn.execute(
+            "SELECT count(*) FROM t_bench_log").fetchall()[0][0], file_name='bench.*', tablename='t_bench_log',
+                    conn=conn, line_beginning=_LINE_BEGINNING, line_matching=_LINE_MATCHING, size_regex=_SIZE_REGEX,
+                    time_regex=_TIME_REGEX, multiprocessing=multiprocessing)
+        _bench_step(rows, 'logs2dfs', ju.logs2dfs, mb=_mb('logs'), count_rows=len, file_name='bench.*',
+                    line_beginning=_LINE_BEGINNING, line_matching=_LINE_MATCHING, size_regex=_SIZE_REGEX,
+                    time_regex=_TIME_REGEX, multiprocessing=multiprocessing, cache=False)
+        count_dfs = lambda rtn: sum(len(df) for df in rtn[1].values() if df is not None and df is not False)
+        _bench_step(rows, 'load_jsons', ju.load_jsons, mb=_mb('engine'), count_rows=count_dfs,
+                    src=os.path.join(bundle_dir, 'engine'), db_conn=conn, cache=False,
+                    multiprocessing=multiprocessing)
+        (names_dict, _) = _bench_step(rows, 'load_csvs', ju.load_csvs, mb=_mb('stats'), count_rows=count_dfs,
+                                      src=os.path.join(bundle_dir, 'stats'), db_conn=conn, cache=False,
+                                      multiprocessing=multiprocessing)
+        names = {'t_log': 't_bench_log', 't_csv': sorted(names_dict.keys())[0]}
+        for (name, sql) in _BENCH_QUERIES.items():
+            for i in range(query_repeat):
+                _bench_step(rows, "query:%s" % (name), ju.query, count_rows=len, sql=sql % names, conn=conn,
+                            no_history=True, cache=False)
+    finally:
+        os.chdir(prev_dir)
+        conn.close()
+        if remove_db:
+            for f in [db_path, db_path + "-wal", db_path + "-shm"]:
+                if os.path.exists(f): os.remove(f)
+    return pd.DataFrame(rows, columns=['step', 'rows', 'mb', 'seconds', 'mb_per_sec', 'rows_per_sec',
+                                       'peak_rss_mb'])
+
+
+def bench_scanners(file_path, engines=['line', 'mmap'], line_beginning=_LINE_BEGINNING, line_matching=_LINE_MATCHING,
+                   size_regex=_SIZE_REGEX, time_regex=_TIME_REGEX, num_cols=7):
+    """
+    Compare the MB/s of _read_file_and_search() engines for one log file
+    :param file_path: A (uncompressed) log file path
+    :param engines: List of engine names
+    :param line_beginning: Regex to find the beginning of the line
+    :param line_matching: Regex to capture column values
+    :param size_regex: Regex to capture size
+    :param time_regex: Regex to capture time/duration
+    :param num_cols: Number of columns
+    :return: A DataFrame object (engine, rows, seconds, mb_per_sec)
+    >>> n = _gen_log('/tmp/test_bench_scanners.log', 0.05, random.Random(1))
+    >>> df = bench_scanners('/tmp/test_bench_scanners.log')
+    >>> df['engine'].tolist(), df['rows'].tolist() == [n, n]
+    (['line', 'mmap'], True)
+    >>> os.remove('/tmp/test_bench_scanners.log')
+    """
+    mb = os.path.getsize(file_path) / 1024.0 / 1024.0
+    rows = []
+    for engine in engines:
+        (sec, n) = _measure(lambda: sum(1 for _ in ju._read_file_and_search(
+            file_path=file_path, line_beginning=line_beginning, line_matching=line_matching, size_regex=size_regex,
+            time_regex=time_regex, num_cols=num_cols, engine=engine)))
+        rows.append([engine, n, sec, (mb / sec) if sec > 0 else None])
+    return pd.DataFrame(rows, columns=['engine', 'rows', 'seconds', 'mb_per_sec'])
+
+
+def bench_inserts(file_name, modes=['default', 'bulk'], db_dir=None, **kwargs):
+    """
+    Compare the rows/s of logs2table() with the default settings and with bulk_load=True (on a DB file)
+    :param file_name: A log file name or glob (same as logs2table)
+    :param modes: List of 'default' and/or 'bulk'
+    :param db_dir: (optional) Directory to create temporary DB files. If None, system's temp directory
+    :param kwargs: Other arguments for logs2table()
+    :return: A DataFrame object (mode, rows, seconds, rows_per_sec)
+    >>> d = tempfile.mkdtemp();n = _gen_log(os.path.join(d, 'bench.log'), 0.05, random.Random(1))
+    >>> prev_dir = os.getcwd();os.chdir(d)
+    >>> df = bench_inserts('bench.log', db_dir=d, line_beginning=_LINE_BEGINNING, line_matching=_LINE_MATCHING)
+    >>> df['mode'].tolist(), df['rows'].tolist() == [n, n], os.listdir(d)
+    (['default', 'bulk'], True, ['bench.log'])
+    >>> os.chdir(prev_dir);import shutil;shutil.rmtree(d)
+    """
+    rows = []
+    for mode in modes:
+        (fd, db_path) = tempfile.mkstemp(suffix='.db', dir=db_dir)
+        os.close(fd)
+        conn = ju._db(db_path)
+        try:
+            (sec, _) = _measure(ju.logs2table, file_name=file_name, tablename='t_bench', conn=conn, indexing=False,
+                                bulk_load=(mode == 'bulk'), **kwargs)
+            n = conn.execute("SELECT count(*) FROM t_bench").fetchall()[0][0]
+        finally:
+            conn.close()
+            os.remove(db_path)
+        rows.append([mode, n, sec, (n / sec) if sec > 0 else None])
+    return pd.DataFrame(rows, columns=['mode', 'rows', 'seconds', 'rows_per_sec'])
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        ju._err("Usage: %s scanners|inserts <log file path>" % (os.path.basename(__file__)))
+        ju._err("       %s bundle <bundle dir> [log MB]" % (os.path.basename(__file__)))
+        sys.exit(1)
+    if sys.argv[1] == 'scanners':
+        print(bench_scanners(sys.argv[2]))
+    elif sys.argv[1] == 'inserts':
+        print(bench_inserts(sys.argv[2]))
+    elif sys.argv[1] == 'bundle':
+        if os.path.isdir(os.path.join(sys.argv[2], 'logs')) is False:
+            gen_bundle(sys.argv[2], log_mb=float(sys.argv[3]) if len(sys.argv) > 3 else 10)
+        pd.set_option("display.width", 200)
+        pd.set_option("display.max_columns", None)
+        print(bench_bundle(sys.argv[2]))